@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 from typing import Optional
 
@@ -11,10 +12,29 @@ class Settings(BaseSettings):
     
     # Database URL (can be overridden or auto-constructed)
     DATABASE_URL: Optional[str] = None
+
+    # Connection Pool Configuration
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 30
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    # "queue" keeps the tuned QueuePool; "null" opens/closes per use,
+    # for multi-worker deployments that would otherwise hoard idle
+    # connections or for one-shot CLI runs
+    POOL_MODE: str = "queue"
+    SQLALCHEMY_ECHO: bool = False
     
     # Ollama Configuration
     OLLAMA_URL: str = "http://ollama:11434"
     OLLAMA_MODEL: str = "sqlcoder:7b"
+    # How long Ollama keeps weights resident after a request; avoids
+    # multi-second cold reloads between queries
+    OLLAMA_KEEP_ALIVE: str = "30m"
+    # Server-side parallelism knobs; docker-compose passes them from the
+    # shared .env into the ollama container, and the defaults here mirror
+    # the compose fallbacks
+    OLLAMA_NUM_PARALLEL: int = 4
+    OLLAMA_MAX_LOADED_MODELS: int = 1
     
     # Backend Configuration
     BACKEND_HOST: str = "0.0.0.0"
@@ -41,4 +61,9 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = False
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    """Build Settings once per process; usable directly or via Depends"""
+    return Settings()
+
+settings = get_settings()
@@ -1,14 +1,87 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, Request, UploadFile, File, HTTPException, Form, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, text, MetaData, Table, Column, Integer, String, inspect
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from anyio import to_thread
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
 from sqlalchemy.exc import SQLAlchemyError
-import pandas as pd
-import requests
-import os
+import httpx
+import json
+import logging
+import orjson
+import functools
+import asyncio
+import re
+import threading
+from contextlib import asynccontextmanager
 from typing import Optional
+from cachetools import TTLCache
 from app.config import settings
+from app.models.database import (
+    engine,
+    get_conn,
+    invalidate_schema_cache,
+    get_cached_table_names,
+    get_cached_table_columns,
+    get_all_table_info,
+    get_schema_text,
+    get_schema_blocks,
+    quote_ident,
+    safe_table,
+    get_table_row_count,
+    get_table_sample,
+    table_exists,
+    test_connection,
+)
+from app.services.data_loader import data_loader
+from app.services.csv_analyzer import csv_analyzer
+from app.services.ollama_service import ollama_service
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+logger = logging.getLogger("hospital")
 
-app = FastAPI(title="Hospital NLP-to-SQL API")
+def _check_database() -> bool:
+    if test_connection():
+        return True
+    logger.warning("Database not reachable at startup")
+    return False
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Size the handler threadpool to the connection pool so sync endpoints
+    # aren't queued behind the default 40-token limiter
+    to_thread.current_default_thread_limiter().total_tokens = (
+        settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    )
+    # Run the readiness probes concurrently so startup pays max(), not sum()
+    db_ok, ollama_ok = await asyncio.gather(
+        asyncio.to_thread(_check_database),
+        ollama_service.check(),
+    )
+    logger.info("Startup checks - database: %s, ollama: %s",
+                "ok" if db_ok else "unavailable",
+                "ok" if ollama_ok else "unavailable")
+    if db_ok:
+        await asyncio.to_thread(refresh_his_ris_view)
+    ollama_service.start()
+    if ollama_ok:
+        # Fire-and-forget, but kept referenced on app.state so the event
+        # loop cannot garbage-collect the task mid-warmup; requests
+        # arriving meanwhile just queue behind it
+        app.state.warmup_task = asyncio.create_task(ollama_service.warm_model())
+    yield
+    await ollama_service.aclose()
+    engine.dispose()
+
+app = FastAPI(
+    title="Hospital NLP-to-SQL API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # CORS
 app.add_middleware(
@@ -19,164 +92,455 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database connection
-engine = create_engine(settings.database_url)
+def _ndjson_response(sql_query, params: Optional[dict] = None):
+    """Stream query rows as NDJSON from a server-side cursor - constant memory"""
+    statement = text(sql_query) if isinstance(sql_query, str) else sql_query
+    def generate():
+        with engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True, yield_per=1000
+            ).execute(statement, params or {})
+            if not result.returns_rows:
+                # A write statement sent through the streaming path (e.g.
+                # /execute-sql with stream=true): commit it and drop the
+                # caches like the materialized branch does, instead of
+                # dying in partitions() and rolling the write back
+                conn.commit()
+                invalidate_schema_cache()
+                _clear_analytics_cache()
+                yield orjson.dumps({"message": "Query executed successfully"}) + b"\n"
+                return
+            for partition in result.partitions(1000):
+                for row in partition:
+                    yield orjson.dumps(dict(row._mapping), default=str) + b"\n"
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+# Responses for read-only dashboard endpoints, cached for a short window.
+# TTLCache is not thread-safe and even reads mutate its bookkeeping, so
+# every access from the threadpooled sync endpoints goes through the lock
+_analytics_cache = TTLCache(maxsize=256, ttl=60)
+_analytics_cache_lock = threading.Lock()
+
+def _clear_analytics_cache():
+    with _analytics_cache_lock:
+        _analytics_cache.clear()
+
+def cached_response(func):
+    """Cache an endpoint's response keyed by name + scalar parameters"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # Streaming responses are one-shot generators - never cache them
+        if kwargs.get("stream"):
+            return func(*args, **kwargs)
+        key = (func.__name__,) + tuple(sorted(
+            (k, v) for k, v in kwargs.items()
+            if isinstance(v, (str, int, float, bool, type(None)))
+        ))
+        with _analytics_cache_lock:
+            try:
+                return _analytics_cache[key]
+            except KeyError:
+                pass
+        response = func(*args, **kwargs)
+        with _analytics_cache_lock:
+            _analytics_cache[key] = response
+        return response
+    return wrapper
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "environment": settings.ENVIRONMENT}
+    return {
+        "status": "healthy",
+        "environment": settings.ENVIRONMENT,
+        "database": "up" if test_connection() else "down",
+    }
+
+@app.get("/tables/exact-count")
+def get_tables_exact_count(conn: Connection = Depends(get_conn)):
+    """Exact COUNT(*) per table, for when the /tables estimates are not enough"""
+    try:
+        tables = get_cached_table_names()
+        if not tables:
+            return {"counts": {}}
+
+        # Exact counts are full scans by design - exempt them from the
+        # pooled statement_timeout; SET LOCAL dies with the request's
+        # transaction, so the connection returns to the pool unchanged
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+
+        # One UNION ALL round-trip; catalog names can be uppercase or
+        # quote-bearing, so both the literal and the identifier are quoted
+        result = conn.execute(text(" UNION ALL ".join(
+            "SELECT '%s' AS name, COUNT(*) AS n FROM %s"
+            % (t.replace("'", "''"), quote_ident(t)) for t in tables
+        )))
+        return {"counts": {row.name: row.n for row in result}}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/upload-csv")
 async def upload_csv(
     file: UploadFile = File(...),
     table_name: str = Form(...),
-    skip_rows: int = Form(0)
+    skip_rows: int = Form(0),
+    detect_header: bool = Form(False)
 ):
     """Upload CSV and convert to PostgreSQL table"""
+    table_name = table_name.strip().lower()
+    if not _TABLE_NAME_RE.match(table_name):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid table name: use lowercase letters, digits and underscores"
+        )
+
     try:
-        upload_dir = "/app/uploads"
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = os.path.join(upload_dir, file.filename)
-        
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        df = pd.read_csv(file_path, skiprows=skip_rows)
-        
-        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_').str.replace('/', '_').str.replace('.', '_')
-        
-        for col in df.columns:
-            df[col] = df[col].astype(str).replace('nan', None)
-        
-        df.insert(0, 'id', range(1, len(df) + 1))
-        
-        # Drop table if exists and create new one
-        with engine.connect() as conn:
-            conn.execute(text(f"DROP TABLE IF EXISTS {table_name} CASCADE"))
-            conn.commit()
-        
-        df.to_sql(table_name, engine, if_exists='replace', index=False)
-        
-        # Add primary key constraint
-        with engine.connect() as conn:
-            conn.execute(text(f"ALTER TABLE {table_name} ADD PRIMARY KEY (id)"))
-            conn.commit()
-        
+        # Starlette has already spooled the body to a temp file; parse it
+        # in place rather than copying it into a second buffer
+        buf = file.file
+        buf.seek(0)
+
+        if detect_header:
+            # The analysis is hash-cached, so when the client ran
+            # /analyze-csv on these bytes this is a lookup, not a re-scan
+            analysis = await run_in_threadpool(csv_analyzer.analyze_file, buf)
+            skip_rows = analysis["skip_rows"]
+            buf.seek(0)
+
+        # Parse exactly once, then hand the same DataFrame to the loader -
+        # both steps block, so they run in the threadpool like any other
+        # sync handler work
+        df = await run_in_threadpool(data_loader.parse_csv, buf, skip_rows)
+        await run_in_threadpool(data_loader.load_csv_data, table_name, df=df)
+
+        invalidate_schema_cache()
+        _clear_analytics_cache()
+
+        # Uploading either source table invalidates (or drops, via CASCADE)
+        # the HIS x RIS rollup - rebuild it while the data is hot
+        if table_name in ("his", "ris"):
+            await run_in_threadpool(refresh_his_ris_view)
+
         return {
             "message": f"Table {table_name} created successfully",
             "rows": len(df),
-            "columns": list(df.columns),
+            "columns": ["id"] + list(df.columns),
             "table_name": table_name
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze-csv")
+async def analyze_csv(file: UploadFile = File(...)):
+    """Detect the header row of a CSV so the client can pre-fill skip_rows"""
+    try:
+        # Starlette already spooled the body; read it where it sits instead
+        # of materializing a second bytes copy
+        file.file.seek(0)
+        return await run_in_threadpool(csv_analyzer.analyze_file, file.file)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/column-stats")
+async def column_stats(file: UploadFile = File(...), skip_rows: int = Form(0)):
+    """Per-column null/unique counts, for spotting primary-key candidates"""
+    try:
+        file.file.seek(0)
+        stats = await run_in_threadpool(csv_analyzer.column_statistics, file.file, skip_rows)
+        return {
+            "columns": stats,
+            "row_count": stats[0]["total_count"] if stats else 0,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/tables")
-def get_tables():
-    """Get list of all tables"""
+@cached_response
+def get_tables(include: str = "", conn: Connection = Depends(get_conn)):
+    """Get list of all tables; include=info,sample folds in key/index metadata and sample rows"""
     try:
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
-        
+        table_columns = get_cached_table_columns()
+        wants = {part.strip() for part in include.split(",") if part.strip()}
+        extra_info = get_all_table_info() if "info" in wants else {}
+
+        # One catalog lookup for approximate counts instead of COUNT(*) scans
+        approx_counts = dict(conn.execute(text("""
+            SELECT c.relname, c.reltuples::bigint
+            FROM pg_class c
+            JOIN pg_namespace n ON c.relnamespace = n.oid
+            WHERE n.nspname = 'public' AND c.relkind = 'r'
+        """)).fetchall())
+
+        # Upload runs ANALYZE, so estimates are fresh; only tables the
+        # planner has never seen (reltuples = -1) need a real COUNT, and
+        # those are batched into a single UNION ALL round-trip
+        unanalyzed = [t for t in table_columns if approx_counts.get(t, -1) < 0]
+        if unanalyzed:
+            exact = conn.execute(text(" UNION ALL ".join(
+                "SELECT '%s' AS relname, COUNT(*) AS n FROM %s"
+                % (t.replace("'", "''"), quote_ident(t)) for t in unanalyzed
+            )))
+            approx_counts.update(exact.fetchall())
+
         table_info = []
-        for table in tables:
-            columns = inspector.get_columns(table)
-            with engine.connect() as conn:
-                result = conn.execute(text(f"SELECT COUNT(*) FROM {table}"))
-                row_count = result.scalar()
-            
-            table_info.append({
+        for table, columns in table_columns.items():
+            entry = {
                 "name": table,
                 "columns": [col['name'] for col in columns],
-                "row_count": row_count
-            })
-        
+                "row_count": approx_counts.get(table, 0)
+            }
+            if "info" in wants:
+                info = extra_info.get(table, {})
+                entry["primary_keys"] = info.get("primary_keys", [])
+                entry["foreign_keys"] = info.get("foreign_keys", [])
+                entry["indexes"] = info.get("indexes", [])
+            if "sample" in wants:
+                entry["sample_data"] = get_table_sample(table, limit=3)
+            table_info.append(entry)
+
         return {"tables": table_info}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Identifiers we are willing to interpolate into DDL
+_TABLE_NAME_RE = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+# Bill-level HIS x RIS rollup shared by the join-heavy analytics queries.
+# Built once per upload instead of re-deriving the join on every request.
+_MV_HIS_RIS_DDL = text("""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_his_ris AS
+    SELECT
+        h.bill_id,
+        h.patient_name,
+        COUNT(DISTINCT h.id) AS his_count,
+        r.patient,
+        COUNT(DISTINCT r.id) AS ris_count
+    FROM his h
+    LEFT JOIN ris r ON h.bill_id = r.patient_id
+    GROUP BY h.bill_id, h.patient_name, r.patient
+""")
+
+def refresh_his_ris_view():
+    """(Re)create and refresh mv_his_ris once both source tables exist"""
+    if not {"his", "ris"} <= set(get_cached_table_names()):
+        return
+    try:
+        # REFRESH ... CONCURRENTLY cannot run inside a transaction block
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            # Autocommit has no transaction for SET LOCAL to scope to, so
+            # lift the session timeout for the refresh and always restore
+            # it before the connection goes back to the pool
+            conn.execute(text("SET statement_timeout = 0"))
+            try:
+                conn.execute(_MV_HIS_RIS_DDL)
+                conn.execute(text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS mv_his_ris_key_idx "
+                    "ON mv_his_ris (bill_id, patient_name, patient)"
+                ))
+                conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_his_ris"))
+            finally:
+                conn.execute(text("RESET statement_timeout"))
+    except SQLAlchemyError as e:
+        logger.warning("Could not refresh mv_his_ris: %s", e)
+
+# Markdown code fences around LLM output, compiled once at import
+_FENCE_RE = re.compile(r"^```(?:sql)?|```$", re.MULTILINE)
+
+# Common sqlcoder join mistake (his.id = ris...), compiled once at import
+_HIS_ID_JOIN_RE = re.compile(r'his\.id\s*=\s*ris', re.IGNORECASE)
+
+# Case-insensitive post-processing patterns, compiled once so validation
+# never allocates uppercased/lowercased copies of a multi-KB query
+_JOIN_RIS_RE = re.compile(r'\bJOIN\s+ris\s+ON\b', re.IGNORECASE)
+_RIS_ID_RE = re.compile(r'\bris\.id\b', re.IGNORECASE)
+_HIS_ID_RE = re.compile(r'\bhis\.id\b', re.IGNORECASE)
+_TEXT_CAST_RE = re.compile(r'::(?:bigint|integer)\b', re.IGNORECASE)
+
+# Columns stored as TEXT that the model loves to cast back to numbers
+_TEXT_COLUMNS = ("bill_id", "patient_id", "patient_mobile_no")
+
+def _minimal_schema(question: str) -> str:
+    """Schema text pruned to the tables the question names.
+
+    Prefill cost grows with prompt length, so when the question mentions
+    specific tables (singular or pluralized) only their CREATE TABLE
+    blocks go into the prompt; a question that names none, or all of
+    them, falls back to the full schema.
+    """
+    blocks = get_schema_blocks()
+    mentioned = [t for t in blocks
+                 if re.search(rf'\b{re.escape(t)}s?\b', question, re.IGNORECASE)]
+    if not mentioned or len(mentioned) == len(blocks):
+        return get_schema_text()
+    return "".join(blocks[t] for t in mentioned)
+
+# Single-pass extraction of the first SELECT/WITH statement from an LLM
+# response, fenced or bare, terminated by a closing fence, ';' or EOF
+_SQL_EXTRACT = re.compile(
+    r'((?:SELECT|WITH)\b[\s\S]+?)(?:```|;|\n\s*\n|\Z)',
+    re.IGNORECASE,
+)
+_STRIP_PREFIX = re.compile(
+    r"^(?:SQL Query:|Here'?s the SQL query:|The SQL query is:|Query:)\s*",
+    re.IGNORECASE,
+)
+
+# Keywords that mutate data or schema anywhere in the statement - a WITH
+# clause can wrap DML (WITH d AS (DELETE ... RETURNING *) SELECT ...),
+# so the first token alone does not make a statement read-only
+_MUTATING_RE = re.compile(
+    r'\b(?:INSERT|UPDATE|DELETE|MERGE|TRUNCATE|DROP|ALTER|CREATE|GRANT|REVOKE|COPY)\b',
+    re.IGNORECASE,
+)
+
+def _is_read_only_statement(sql_query: str) -> bool:
+    """First-token check, mutating-keyword scan and stacked-statement rejection"""
+    head = sql_query.lstrip()[:7].upper()
+    if not (head.startswith("SELECT") or head.startswith("WITH")):
+        return False
+    if _MUTATING_RE.search(sql_query):
+        return False
+    # Any ';' followed by more content means stacked statements
+    semicolon = sql_query.find(";")
+    return semicolon == -1 or not sql_query[semicolon + 1:].strip("; \t\r\n")
+
 def clean_sql_query(sql_text: str) -> str:
     """Clean and extract SQL query from LLM response"""
-    
-    sql_text = sql_text.replace("```sql", "").replace("```", "")
-    
-    prefixes_to_remove = [
-        "SQL Query:",
-        "Here's the SQL query:",
-        "The SQL query is:",
-        "Query:",
-        "SELECT",  
-    ]
-    
-    original = sql_text
-    for prefix in prefixes_to_remove:
-        if sql_text.strip().startswith(prefix) and prefix != "SELECT":
-            sql_text = sql_text.strip()[len(prefix):].strip()
-    
-    if original.strip().upper().startswith("SELECT") and not sql_text.strip().upper().startswith("SELECT"):
-        sql_text = "SELECT " + sql_text
-    
-    sql_text = sql_text.rstrip(';').strip()
-    
-    if '\n\n' in sql_text:
-        lines = sql_text.split('\n\n')
-        for line in lines:
-            clean_line = line.strip()
-            if clean_line.upper().startswith('SELECT'):
-                return clean_line
-    
-    if not sql_text.upper().startswith('SELECT'):
-        for line in sql_text.split('\n'):
-            if line.strip().upper().startswith('SELECT'):
-                return line.strip()
-    
-    return sql_text
+    match = _SQL_EXTRACT.search(sql_text)
+    if match:
+        return match.group(1).strip().rstrip(';').strip()
+
+    # No SELECT/WITH found - strip fences and chatter and return the rest
+    sql_text = _FENCE_RE.sub("", sql_text)
+    return _STRIP_PREFIX.sub("", sql_text.strip()).rstrip(';').strip()
+
+@functools.lru_cache(maxsize=8)
+def _table_name_fixer(tables: tuple):
+    """One compiled alternation mapping pluralized table names back to the
+    real ones; rebuilt only when the table list changes"""
+    replacements = {f"{t}s": t for t in tables if f"{t}s" not in tables}
+    if not replacements:
+        return None, {}
+    pattern = re.compile(
+        r'\b(' + '|'.join(re.escape(p) for p in replacements) + r')\b',
+        re.IGNORECASE,
+    )
+    return pattern, replacements
+
+def _fix_table_names_in_sql(sql_query: str) -> tuple[str, list[str]]:
+    """Rewrite pluralized table references ('FROM hiss') in one regex pass"""
+    pattern, replacements = _table_name_fixer(tuple(get_cached_table_names()))
+    if pattern is None:
+        return sql_query, []
+    warnings = []
+
+    def replace(match):
+        fixed = replacements[match.group(1).lower()]
+        warnings.append(f"Fixed: Changed table name '{match.group(1)}' to '{fixed}'")
+        return fixed
+
+    return pattern.sub(replace, sql_query), warnings
 
 def validate_and_fix_sql(sql_query: str) -> tuple[str, list[str]]:
     """Validate SQL query and fix common mistakes. Returns (fixed_query, warnings)"""
-    warnings = []
-    fixed_query = sql_query
-    
-    if 'JOIN ris ON' in sql_query.upper():
-        if 'ris.id' in sql_query.lower() or 'ON his.bill_id = ris.id' in sql_query.lower():
+    fixed_query, warnings = _fix_table_names_in_sql(sql_query)
+
+    if _JOIN_RIS_RE.search(sql_query):
+        if _RIS_ID_RE.search(fixed_query):
             warnings.append("Fixed: Changed 'ris.id' to 'ris.patient_id' in JOIN condition")
-            fixed_query = fixed_query.replace('ris.id', 'ris.patient_id')
-            fixed_query = fixed_query.replace('RIS.id', 'ris.patient_id')
-        
-        if 'his.id' in sql_query.lower() and 'JOIN' in sql_query.upper():
+            fixed_query = _RIS_ID_RE.sub('ris.patient_id', fixed_query)
+
+        if _HIS_ID_RE.search(fixed_query):
             warnings.append("Fixed: Changed 'his.id' to 'his.bill_id' in JOIN condition")
-            import re
-            fixed_query = re.sub(r'his\.id\s*=\s*ris', 'his.bill_id = ris', fixed_query, flags=re.IGNORECASE)
-    
-    if any(col in sql_query for col in ['bill_id', 'patient_id', 'patient_mobile_no']):
-        if '::bigint' in sql_query.lower() or '::integer' in sql_query.lower():
-            warnings.append("Removed incorrect type casting - these columns are TEXT type")
-            fixed_query = fixed_query.replace('::bigint', '').replace('::BIGINT', '')
-            fixed_query = fixed_query.replace('::integer', '').replace('::INTEGER', '')
-    
+            fixed_query = _HIS_ID_JOIN_RE.sub('his.bill_id = ris', fixed_query)
+
+    if any(col in fixed_query for col in _TEXT_COLUMNS) and _TEXT_CAST_RE.search(fixed_query):
+        warnings.append("Removed incorrect type casting - these columns are TEXT type")
+        fixed_query = _TEXT_CAST_RE.sub('', fixed_query)
+
     return fixed_query, warnings
 
+def _sql_generate_options(prompt: str, num_predict: int = 256,
+                          stop=("```", "\n\n\n", "###")) -> dict:
+    """Decode options sized to the call: a tight completion budget (SQL
+    rarely runs past 100 tokens) and a context window proportional to the
+    prompt at ~4 chars/token, so each request's KV cache claims only the
+    VRAM it needs instead of the model's default window"""
+    return {
+        "temperature": 0.1,
+        "num_predict": num_predict,
+        "num_ctx": max(2048, len(prompt) // 4 + num_predict),
+        "stop": list(stop),
+    }
+
+async def _stream_query_events(prompt: str):
+    """Forward Ollama tokens as NDJSON events, then execute the SQL and emit the result"""
+    raw_response = ""
+    try:
+        async with ollama_service.stream_generate({
+            "model": settings.OLLAMA_MODEL,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+            "options": _sql_generate_options(prompt)
+        }) as resp:
+            if resp.status_code != 200:
+                body = await resp.aread()
+                yield json.dumps({"error": f"Ollama error: {body.decode(errors='ignore')[:200]}"}) + "\n"
+                return
+
+            async for line in resp.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("response", "")
+                if token:
+                    raw_response += token
+                    yield json.dumps({"token": token}) + "\n"
+                    # A terminated statement means anything further is
+                    # chatter; closing the stream cancels the generation
+                    # instead of decoding on toward num_predict
+                    if raw_response.rstrip().endswith(";"):
+                        break
+                if chunk.get("done"):
+                    break
+
+        sql_query = clean_sql_query(raw_response.strip())
+        if not sql_query or not _is_read_only_statement(sql_query):
+            yield json.dumps({"error": f"Invalid SQL query generated. Raw response: {raw_response[:200]}"}) + "\n"
+            return
+
+        sql_query, warnings = validate_and_fix_sql(sql_query)
+
+        def run_query():
+            with engine.connect() as conn:
+                result = conn.execute(text(sql_query))
+                return [dict(m) for m in result.mappings()]
+
+        data = await run_in_threadpool(run_query)
+
+        final_event = {
+            "sql_query": sql_query,
+            "results": data,
+            "row_count": len(data)
+        }
+        if warnings:
+            final_event["warnings"] = warnings
+            final_event["original_query"] = raw_response
+        yield json.dumps(final_event, default=str) + "\n"
+
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+
 @app.post("/query")
-async def natural_language_query(query: str = Form(...)):
+async def natural_language_query(query: str = Form(...), stream: bool = Form(False)):
     """Convert natural language to SQL and execute"""
     try:
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
-        
-        schema_info = ""
-        for table in tables:
-            columns = inspector.get_columns(table)
-            col_definitions = []
-            
-            for col in columns:
-                col_type = "TEXT" if col['name'] != 'id' else "BIGINT"
-                col_definitions.append(f"  {col['name']} {col_type}")
-            
-            schema_info += f"CREATE TABLE {table} (\n" + ",\n".join(col_definitions) + "\n);\n\n"
-        
+        # Cold cache rebuilds hit the catalog - keep that off the event loop
+        schema_info = await run_in_threadpool(_minimal_schema, query)
+
         prompt = f"""### Task
 Generate a SQL query to answer the following question: `{query}`
 
@@ -193,7 +557,14 @@ Given the database schema, here is the SQL query that answers `{query}`:
 ```sql
 """
 
-        print(f"Prompt for sqlcoder:\n{prompt}\n")
+        logger.debug("Prompt for sqlcoder:\n%s", prompt)
+
+        # Streaming clients get tokens as they are generated, then the result
+        if stream:
+            return StreamingResponse(
+                _stream_query_events(prompt),
+                media_type="application/x-ndjson"
+            )
 
         max_retries = 2
         timeout_seconds = 120
@@ -203,51 +574,44 @@ Given the database schema, here is the SQL query that answers `{query}`:
         
         for attempt in range(max_retries):
             try:
-                print(f"[Attempt {attempt + 1}/{max_retries}] Calling Ollama...")
-                
-                ollama_response = requests.post(
-                    f"{settings.OLLAMA_URL}/api/generate",
-                    json={
-                        "model": settings.OLLAMA_MODEL,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.1,
-                            "num_predict": 1000, 
-                            "stop": ["```", "\n\n\n", "###"] 
-                        }
-                    },
-                    timeout=timeout_seconds
-                )
-                
-                print(f"[Attempt {attempt + 1}] Response status: {ollama_response.status_code}")
-                print(f"[Attempt {attempt + 1}] Response preview: {ollama_response.text[:200]}")
-                
+                logger.info("[Attempt %d/%d] Calling Ollama...", attempt + 1, max_retries)
+
+                ollama_response = await ollama_service.generate({
+                    "model": settings.OLLAMA_MODEL,
+                    "prompt": prompt,
+                    "stream": False,
+                    "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+                    "options": _sql_generate_options(prompt)
+                })
+
+                logger.info("[Attempt %d] Response status: %s", attempt + 1, ollama_response.status_code)
+                logger.debug("[Attempt %d] Response preview: %s", attempt + 1, ollama_response.text[:200])
+
                 if ollama_response.status_code == 200:
-                    break 
+                    break
                 else:
                     last_error = f"Status {ollama_response.status_code}: {ollama_response.text}"
-                    
-            except requests.exceptions.Timeout:
+
+            except httpx.TimeoutException:
                 last_error = f"Timeout after {timeout_seconds} seconds"
-                print(f"[Attempt {attempt + 1}] {last_error}")
+                logger.warning("[Attempt %d] %s", attempt + 1, last_error)
                 if attempt < max_retries - 1:
-                    continue  
+                    continue
                 else:
                     raise HTTPException(
-                        status_code=504, 
+                        status_code=504,
                         detail=f"Ollama request timed out after {timeout_seconds} seconds. The model may be overloaded or the query is too complex. Try simplifying your question."
                     )
-            except requests.exceptions.ConnectionError as e:
+            except httpx.ConnectError as e:
                 last_error = f"Connection error: {str(e)}"
-                print(f"[Attempt {attempt + 1}] {last_error}")
+                logger.warning("[Attempt %d] %s", attempt + 1, last_error)
                 raise HTTPException(
                     status_code=503,
                     detail="Cannot connect to Ollama service. Please ensure Ollama is running."
                 )
             except Exception as e:
                 last_error = f"Unexpected error: {str(e)}"
-                print(f"[Attempt {attempt + 1}] {last_error}")
+                logger.warning("[Attempt %d] %s", attempt + 1, last_error)
         
         if not ollama_response or ollama_response.status_code != 200:
             raise HTTPException(
@@ -256,7 +620,7 @@ Given the database schema, here is the SQL query that answers `{query}`:
             )
 
         response_json = ollama_response.json()
-        print(f"Full Ollama response: {response_json}")
+        logger.debug("Full Ollama response: %s", response_json)
         
         raw_response = response_json.get("response", "").strip()
         
@@ -284,27 +648,26 @@ Given the database schema, here is the SQL query that answers `{query}`:
                 detail=f"LLM returned an empty response. Full JSON: {response_json}"
             )
         
-        print(f"Raw LLM response: {raw_response}")
+        logger.debug("Raw LLM response: %s", raw_response)
         
         sql_query = clean_sql_query(raw_response)
-        
-        if not sql_query or not sql_query.upper().startswith('SELECT'):
+
+        # Only read-only statements may reach the database from the LLM path
+        if not sql_query or not _is_read_only_statement(sql_query):
             raise HTTPException(
-                status_code=400, 
+                status_code=400,
                 detail=f"Invalid SQL query generated. Raw response: {raw_response[:200]}"
             )
         
         sql_query, warnings = validate_and_fix_sql(sql_query)
-        
-        with engine.connect() as conn:
-            conn.execute(text("SET statement_timeout = 30000"))
-            
-            result = conn.execute(text(sql_query))
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        data = [dict(zip(columns, row)) for row in rows]
-        
+
+        def run_query():
+            with engine.connect() as conn:
+                result = conn.execute(text(sql_query))
+                return [dict(m) for m in result.mappings()]
+
+        data = await run_in_threadpool(run_query)
+
         response_data = {
             "sql_query": sql_query,
             "results": data,
@@ -316,44 +679,163 @@ Given the database schema, here is the SQL query that answers `{query}`:
             response_data["original_query"] = raw_response
         
         return response_data
-    
+
+    except HTTPException:
+        raise
     except SQLAlchemyError as e:
         raise HTTPException(status_code=400, detail=f"SQL Error: {str(e)}")
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         raise HTTPException(
-            status_code=504, 
+            status_code=504,
             detail="Request timed out. Try simplifying your query or check if Ollama is responding."
         )
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"Ollama service error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# '[n] SELECT ...' entries in a batched response, each terminated by a
+# ';', the next index tag or end of output
+_SQL_BATCH_RE = re.compile(
+    r'\[(\d+)\]\s*((?:SELECT|WITH)\b.*?)(?=;|\n\s*\[\d+\]|\Z)',
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Past this the response window grows enough that batching stops paying
+_QUERY_BATCH_MAX = 8
+
+@app.post("/query-batch")
+async def natural_language_query_batch(questions: str = Form(...)):
+    """Convert up to 8 newline-separated questions in one LLM call
+
+    The schema block dominates the prompt, so sharing its prefill across
+    the batch is far cheaper than one Ollama round-trip per question.
+    """
+    try:
+        question_list = [q.strip() for q in questions.splitlines() if q.strip()]
+        if not question_list:
+            raise HTTPException(status_code=400, detail="No questions supplied")
+        if len(question_list) > _QUERY_BATCH_MAX:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {_QUERY_BATCH_MAX} questions per batch"
+            )
+
+        schema_info = await run_in_threadpool(_minimal_schema, questions)
+        numbered = "\n".join(f"[{i + 1}] {q}" for i, q in enumerate(question_list))
+        prompt = f"""### Task
+Generate one SQL query per numbered question below.
+
+### Database Schema
+{schema_info}
+
+### Important Notes
+- To join HIS and RIS tables, use: his.bill_id = ris.patient_id
+- his.id and ris.id are auto-generated primary keys, do NOT use them for joins
+- All columns except id are TEXT type
+
+### Questions
+{numbered}
+
+### Answer
+One line per question, in the form `[n] SELECT ...;`:
+[1]"""
+
+        response = await ollama_service.generate({
+            "model": settings.OLLAMA_MODEL,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+            # A full batch is up to 8 statements, so the completion budget
+            # scales with the batch instead of the single-query default
+            "options": _sql_generate_options(
+                prompt,
+                num_predict=256 * len(question_list),
+                stop=("###", "\n\n\n"),
+            )
+        })
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Ollama error: status {response.status_code}"
+            )
+
+        # The prompt seeds '[1]', so stitch it back before extracting
+        raw_response = "[1]" + response.json().get("response", "")
+        extracted = {int(i): sql.strip() for i, sql in _SQL_BATCH_RE.findall(raw_response)}
+
+        async def run_one(index: int, question: str) -> dict:
+            entry = {"question": question}
+            sql_query = extracted.get(index, "").rstrip(';').strip()
+            if not sql_query or not _is_read_only_statement(sql_query):
+                entry["error"] = "Invalid SQL query generated"
+                return entry
+            sql_query, warnings = validate_and_fix_sql(sql_query)
+            entry["sql_query"] = sql_query
+
+            def run_query():
+                with engine.connect() as conn:
+                    result = conn.execute(text(sql_query))
+                    return [dict(m) for m in result.mappings()]
+
+            try:
+                data = await run_in_threadpool(run_query)
+            except SQLAlchemyError as e:
+                entry["error"] = f"SQL Error: {str(e)}"
+                return entry
+            entry["results"] = data
+            entry["row_count"] = len(data)
+            if warnings:
+                entry["warnings"] = warnings
+            return entry
+
+        results = await asyncio.gather(
+            *(run_one(i + 1, q) for i, q in enumerate(question_list))
+        )
+        return {"results": list(results)}
+
+    except HTTPException:
+        raise
+    except httpx.TimeoutException:
+        raise HTTPException(
+            status_code=504,
+            detail="Request timed out. Try fewer questions per batch."
+        )
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=503, detail=f"Ollama service error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/execute-sql")
-async def execute_sql(sql: str = Form(...)):
+def execute_sql(request: Request, sql: str = Form(...), stream: bool = Form(False), conn: Connection = Depends(get_conn)):
     """Execute raw SQL query"""
+    # Stream when asked explicitly or when the client negotiates NDJSON;
+    # the default stays materialized JSON for the dashboard
+    if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        return _ndjson_response(sql)
+
     try:
-        with engine.connect() as conn:
-            
-            conn.execute(text("SET statement_timeout = 30000"))
-            
-            result = conn.execute(text(sql))
-            
-            if result.returns_rows:
-                rows = result.fetchall()
-                columns = result.keys()
-                data = [dict(zip(columns, row)) for row in rows]
-                return {
-                    "sql_query": sql,
-                    "results": data,
-                    "row_count": len(data)
-                }
-            else:
-                conn.commit()
-                return {
-                    "sql_query": sql,
-                    "message": "Query executed successfully"
-                }
+        # Server-side cursor caps driver-side buffering on large result sets
+        result = conn.execution_options(stream_results=True, yield_per=1000).execute(text(sql))
+
+        if result.returns_rows:
+            data = [dict(m) for m in result.mappings()]
+            return {
+                "sql_query": sql,
+                "results": data,
+                "row_count": len(data)
+            }
+        else:
+            conn.commit()
+            # A non-SELECT statement may have changed the data under the
+            # cached dashboard responses - and DDL changes the schema the
+            # table list and LLM prompt are built from
+            invalidate_schema_cache()
+            _clear_analytics_cache()
+            return {
+                "sql_query": sql,
+                "message": "Query executed successfully"
+            }
     
     except SQLAlchemyError as e:
         raise HTTPException(status_code=400, detail=f"SQL Error: {str(e)}")
@@ -361,15 +843,21 @@ async def execute_sql(sql: str = Form(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/table/{table_name}")
-def get_table_data(table_name: str, limit: int = 100):
+def get_table_data(table_name: str, limit: int = 100, stream: bool = False, conn: Connection = Depends(get_conn)):
     """Get data from specific table"""
+    # safe_table resolves against the live catalog (the cached list can be
+    # minutes stale) and returns the identifier quoted for interpolation
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text(f"SELECT * FROM {table_name} LIMIT {limit}"))
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        data = [dict(zip(columns, row)) for row in rows]
+        quoted = safe_table(table_name)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Table {table_name} not found")
+
+    if stream:
+        return _ndjson_response(f"SELECT * FROM {quoted} LIMIT :lim", {"lim": int(limit)})
+
+    try:
+        result = conn.execute(text(f"SELECT * FROM {quoted} LIMIT :lim"), {"lim": int(limit)})
+        data = [dict(m) for m in result.mappings()]
         
         return {
             "table_name": table_name,
@@ -380,14 +868,36 @@ def get_table_data(table_name: str, limit: int = 100):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/table/{table_name}/count")
+def get_table_count(table_name: str, exact: bool = False):
+    """Row count for one table; pass exact=true to force a real COUNT(*)"""
+    if not table_exists(table_name):
+        raise HTTPException(status_code=404, detail=f"Table {table_name} not found")
+
+    try:
+        return {
+            "table_name": table_name,
+            "row_count": get_table_row_count(table_name, exact=exact),
+            "exact": exact,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/table/{table_name}")
 def delete_table(table_name: str):
     """Delete a table"""
     try:
-        with engine.connect() as conn:
-            conn.execute(text(f"DROP TABLE IF EXISTS {table_name} CASCADE"))
-            conn.commit()
-        
+        quoted = safe_table(table_name)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Table {table_name} not found")
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {quoted} CASCADE"))
+
+        invalidate_schema_cache()
+        _clear_analytics_cache()
+
         return {"message": f"Table {table_name} deleted successfully"}
     
     except Exception as e:
@@ -397,26 +907,15 @@ def delete_table(table_name: str):
 def get_schema_info():
     """Get detailed schema information with relationships"""
     try:
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
-        
         schema = {}
-        for table in tables:
-            columns = inspector.get_columns(table)
-            
-            with engine.connect() as conn:
-                sample = conn.execute(text(f"SELECT * FROM {table} LIMIT 3"))
-                sample_rows = [dict(zip(sample.keys(), row)) for row in sample.fetchall()]
-            
+        for table, info in get_all_table_info().items():
+            sample_rows = get_table_sample(table, limit=3)
+
             schema[table] = {
-                "columns": [
-                    {
-                        "name": col['name'],
-                        "type": str(col['type']),
-                        "nullable": col['nullable']
-                    }
-                    for col in columns
-                ],
+                "columns": info["columns"],
+                "primary_keys": info["primary_keys"],
+                "foreign_keys": info["foreign_keys"],
+                "indexes": info["indexes"],
                 "sample_data": sample_rows
             }
         
@@ -442,6 +941,42 @@ def get_schema_info():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/suggest-questions")
+async def suggest_questions():
+    """Example questions for the UI, built from cached schema metadata"""
+    try:
+        info = await run_in_threadpool(get_all_table_info)
+        tables = list(info)[:3]
+        # The per-table sample reads are independent - overlap them on
+        # separate pooled connections instead of awaiting one by one
+        samples = await asyncio.gather(
+            *(run_in_threadpool(get_table_sample, table, 1) for table in tables)
+        )
+
+        suggestions = []
+        for table, sample in zip(tables, samples):
+            columns = [c["name"] for c in info[table]["columns"] if c["name"] != "id"]
+            suggestions.append(f"How many records are in {table}?")
+            if columns:
+                suggestions.append(
+                    f"What are the 10 most common values of {columns[0]} in {table}?"
+                )
+            if sample and columns:
+                value = sample[0].get(columns[0])
+                if value:
+                    suggestions.append(
+                        f"Show all {table} records where {columns[0]} is '{value}'"
+                    )
+        if {"his", "ris"} <= set(info):
+            suggestions.append("Which bills are missing in RIS?")
+            suggestions.append(
+                "Which patients have mismatched service counts between HIS and RIS?"
+            )
+        return {"suggestions": suggestions}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/config")
 def get_config():
     """Get current configuration (for debugging)"""
@@ -457,8 +992,8 @@ def get_config():
 async def test_ollama(prompt: str = Form("Say hello")):
     """Test Ollama connectivity and response"""
     try:
-        response = requests.post(
-            f"{settings.OLLAMA_URL}/api/generate",
+        response = await ollama_service.client.post(
+            "/api/generate",
             json={
                 "model": settings.OLLAMA_MODEL,
                 "prompt": prompt,
@@ -470,7 +1005,7 @@ async def test_ollama(prompt: str = Form("Say hello")):
             },
             timeout=30
         )
-        
+
         return {
             "status_code": response.status_code,
             "response_json": response.json(),
@@ -483,10 +1018,10 @@ async def test_ollama(prompt: str = Form("Say hello")):
         }
 
 @app.get("/ollama-health")
-def check_ollama():
+async def check_ollama():
     """Check if Ollama is responding"""
     try:
-        response = requests.get(f"{settings.OLLAMA_URL}/api/tags", timeout=5)
+        response = await ollama_service.client.get("/api/tags", timeout=5)
         if response.status_code == 200:
             models = response.json().get('models', [])
             return {
@@ -499,446 +1034,437 @@ def check_ollama():
     except Exception as e:
         return {"status": "unreachable", "error": str(e)}
 
+# Both halves of the /validate-data report, built once at import
+_SQL_VALIDATION_REPORT = text("""
+                WITH his_stats AS (
+                    SELECT COUNT(*) AS total, COUNT(DISTINCT bill_id) AS uniq FROM his
+                ),
+                ris_stats AS (
+                    SELECT COUNT(*) AS total, COUNT(DISTINCT patient_id) AS uniq FROM ris
+                ),
+                his_services AS (
+                    SELECT bill_id, COUNT(*) AS service_count, patient_name
+                    FROM his
+                    GROUP BY bill_id, patient_name
+                    ORDER BY service_count DESC
+                    LIMIT 50
+                ),
+                ris_entries AS (
+                    SELECT patient_id, COUNT(*) AS entry_count, patient
+                    FROM ris
+                    GROUP BY patient_id, patient
+                    ORDER BY entry_count DESC
+                    LIMIT 50
+                ),
+                mismatched AS (
+                    SELECT
+                        bill_id,
+                        patient_name AS his_name,
+                        his_count AS his_services,
+                        patient AS ris_name,
+                        ris_count AS ris_services
+                    FROM mv_his_ris
+                    WHERE his_count != ris_count
+                )
+                SELECT json_build_object(
+                    'his_total', (SELECT total FROM his_stats),
+                    'his_unique', (SELECT uniq FROM his_stats),
+                    'ris_total', (SELECT total FROM ris_stats),
+                    'ris_unique', (SELECT uniq FROM ris_stats),
+                    'his_service_counts', (
+                        SELECT COALESCE(json_agg(json_build_object(
+                            'bill_id', bill_id, 'services', service_count, 'patient', patient_name
+                        )), '[]'::json) FROM his_services
+                    ),
+                    'ris_entry_counts', (
+                        SELECT COALESCE(json_agg(json_build_object(
+                            'patient_id', patient_id, 'entries', entry_count, 'patient', patient
+                        )), '[]'::json) FROM ris_entries
+                    ),
+                    'mismatched_records', (
+                        SELECT COALESCE(json_agg(json_build_object(
+                            'bill_id', bill_id, 'his_name', his_name, 'his_services', his_services,
+                            'ris_name', ris_name, 'ris_services', ris_services
+                        )), '[]'::json) FROM mismatched
+                    )
+                )
+""")
+
+_SQL_MISSING_IDS = text("""
+                SELECT 'ris' AS missing_in, bill_id AS missing_id
+                FROM mv_his_ris
+                WHERE ris_count = 0
+                GROUP BY bill_id
+                UNION ALL
+                SELECT 'his' AS missing_in, r.patient_id AS missing_id
+                FROM ris r
+                LEFT JOIN his h ON r.patient_id = h.bill_id
+                WHERE h.bill_id IS NULL
+                GROUP BY r.patient_id
+""")
+
 @app.get("/validate-data")
-def validate_data():
+async def validate_data():
     """Check data consistency between HIS and RIS tables"""
     try:
-        with engine.connect() as conn:
-            # Count total records
-            his_count = conn.execute(text("SELECT COUNT(*) FROM his")).scalar()
-            ris_count = conn.execute(text("SELECT COUNT(*) FROM ris")).scalar()
-            
-            # Count unique bill_id/patient_id
-            his_unique = conn.execute(text("SELECT COUNT(DISTINCT bill_id) FROM his")).scalar()
-            ris_unique = conn.execute(text("SELECT COUNT(DISTINCT patient_id) FROM ris")).scalar()
-            
-            # Find missing bill_ids in RIS
-            missing_in_ris = conn.execute(text("""
-                SELECT DISTINCT h.bill_id 
-                FROM his h 
-                LEFT JOIN ris r ON h.bill_id = r.patient_id 
-                WHERE r.patient_id IS NULL
-            """)).fetchall()
-            
-            # Find missing patient_ids in HIS
-            missing_in_his = conn.execute(text("""
-                SELECT DISTINCT r.patient_id 
-                FROM ris r 
-                LEFT JOIN his h ON r.patient_id = h.bill_id 
-                WHERE h.bill_id IS NULL
-            """)).fetchall()
-            
-            # Count services per bill_id in HIS
-            his_services = conn.execute(text("""
-                SELECT bill_id, COUNT(*) as service_count, patient_name
-                FROM his 
-                GROUP BY bill_id, patient_name
-                ORDER BY service_count DESC
-            """)).fetchall()
-            
-            # Count entries per patient_id in RIS
-            ris_entries = conn.execute(text("""
-                SELECT patient_id, COUNT(*) as entry_count, patient
-                FROM ris 
-                GROUP BY patient_id, patient
-                ORDER BY entry_count DESC
-            """)).fetchall()
-            
-            # Compare counts - patients with mismatched service counts
-            mismatched = conn.execute(text("""
-                SELECT 
-                    h.bill_id,
-                    h.patient_name as his_name,
-                    COUNT(DISTINCT h.id) as his_services,
-                    r.patient as ris_name,
-                    COUNT(DISTINCT r.id) as ris_services
-                FROM his h
-                LEFT JOIN ris r ON h.bill_id = r.patient_id
-                GROUP BY h.bill_id, h.patient_name, r.patient
-                HAVING COUNT(DISTINCT h.id) != COUNT(DISTINCT r.id)
-            """)).fetchall()
-            
-            return {
-                "summary": {
-                    "his_total_records": his_count,
-                    "ris_total_records": ris_count,
-                    "his_unique_bill_ids": his_unique,
-                    "ris_unique_patient_ids": ris_unique,
-                    "missing_in_ris_count": len(missing_in_ris),
-                    "missing_in_his_count": len(missing_in_his),
-                    "mismatched_count": len(mismatched)
-                },
-                "missing_in_ris": [row[0] for row in missing_in_ris],
-                "missing_in_his": [row[0] for row in missing_in_his],
-                "his_service_counts": [
-                    {"bill_id": row[0], "services": row[1], "patient": row[2]} 
-                    for row in his_services[:50]
-                ],
-                "ris_entry_counts": [
-                    {"patient_id": row[0], "entries": row[1], "patient": row[2]} 
-                    for row in ris_entries[:50]
-                ],
-                "mismatched_records": [
-                    {
-                        "bill_id": row[0],
-                        "his_name": row[1],
-                        "his_services": row[2],
-                        "ris_name": row[3],
-                        "ris_services": row[4]
-                    } 
-                    for row in mismatched
-                ]
-            }
-    
+        def run_report():
+            with engine.connect() as conn:
+                return conn.execute(_SQL_VALIDATION_REPORT).scalar()
+
+        def run_missing():
+            with engine.connect() as conn:
+                return conn.execute(_SQL_MISSING_IDS).fetchall()
+
+        # The two statements are independent - overlap them on separate
+        # pooled connections so the endpoint costs max(), not sum()
+        report, missing_rows = await asyncio.gather(
+            run_in_threadpool(run_report),
+            run_in_threadpool(run_missing),
+        )
+
+        missing_in_ris = [row[1] for row in missing_rows if row[0] == 'ris']
+        missing_in_his = [row[1] for row in missing_rows if row[0] == 'his']
+
+        return {
+            "summary": {
+                "his_total_records": report['his_total'],
+                "ris_total_records": report['ris_total'],
+                "his_unique_bill_ids": report['his_unique'],
+                "ris_unique_patient_ids": report['ris_unique'],
+                "missing_in_ris_count": len(missing_in_ris),
+                "missing_in_his_count": len(missing_in_his),
+                "mismatched_count": len(report['mismatched_records'])
+            },
+            "missing_in_ris": missing_in_ris,
+            "missing_in_his": missing_in_his,
+            "his_service_counts": report['his_service_counts'],
+            "ris_entry_counts": report['ris_entry_counts'],
+            "mismatched_records": report['mismatched_records']
+        }
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Analytics statements built once at import: reusing the same text()
+# construct lets SQLAlchemy's compiled cache skip re-parsing per request
+_SQL_RECORDS_COMPARISON = text("""
+    SELECT
+        'HIS' as source,
+        COUNT(*) as total_records,
+        COUNT(DISTINCT bill_id) as unique_ids
+    FROM his
+    UNION ALL
+    SELECT
+        'RIS' as source,
+        COUNT(*) as total_records,
+        COUNT(DISTINCT patient_id) as unique_ids
+    FROM ris
+""")
+
+_SQL_SERVICES_PER_PATIENT = text("""
+    SELECT
+        bill_id,
+        patient_name,
+        COUNT(*) as service_count,
+        STRING_AGG(DISTINCT service_description, ', ') as services
+    FROM his
+    GROUP BY bill_id, patient_name
+    ORDER BY service_count DESC
+    LIMIT 100
+""")
+
+_SQL_MISSING_IN_RIS = text("""
+    SELECT
+        bill_id,
+        patient_name,
+        his_count as his_services
+    FROM mv_his_ris
+    WHERE ris_count = 0
+""")
+
+_SQL_SERVICE_MISMATCH = text("""
+    SELECT
+        bill_id,
+        patient_name as his_name,
+        his_count,
+        patient as ris_name,
+        ris_count,
+        ABS(his_count - ris_count) as difference
+    FROM mv_his_ris
+    WHERE his_count != ris_count
+    ORDER BY difference DESC
+""")
+
+_SQL_DAILY_TRENDS = text("""
+    SELECT
+        bill_date as date,
+        COUNT(*) as total_services,
+        COUNT(DISTINCT bill_id) as unique_patients,
+        COUNT(DISTINCT service_description) as service_types
+    FROM his
+    GROUP BY bill_date
+    ORDER BY bill_date DESC
+""")
+
+_SQL_TOP_SERVICES = text("""
+    SELECT
+        service_description,
+        COUNT(*) as count,
+        COUNT(DISTINCT bill_id) as unique_patients
+    FROM his
+    GROUP BY service_description
+    ORDER BY count DESC
+    LIMIT 20
+""")
+
 @app.get("/analytics/records-comparison")
-def records_comparison():
+@cached_response
+def records_comparison(stream: bool = False, conn: Connection = Depends(get_conn)):
     """Query 1: Total Records Comparison"""
+    if stream:
+        return _ndjson_response(_SQL_RECORDS_COMPARISON)
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT 
-                    'HIS' as source,
-                    COUNT(*) as total_records,
-                    COUNT(DISTINCT bill_id) as unique_ids
-                FROM his
-                UNION ALL
-                SELECT 
-                    'RIS' as source,
-                    COUNT(*) as total_records,
-                    COUNT(DISTINCT patient_id) as unique_ids
-                FROM ris
-            """))
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        result = conn.execute(_SQL_RECORDS_COMPARISON)
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/analytics/services-per-patient")
-def services_per_patient():
+@cached_response
+def services_per_patient(conn: Connection = Depends(get_conn)):
     """Query 2: Services per Patient (HIS)"""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT 
-                    bill_id,
-                    patient_name,
-                    COUNT(*) as service_count,
-                    STRING_AGG(DISTINCT service_description, ', ') as services
-                FROM his
-                GROUP BY bill_id, patient_name
-                ORDER BY service_count DESC
-                LIMIT 100
-            """))
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        result = conn.execute(_SQL_SERVICES_PER_PATIENT)
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/analytics/missing-in-ris")
-def missing_in_ris():
+@cached_response
+def missing_in_ris(conn: Connection = Depends(get_conn)):
     """Query 3: Missing Records in RIS"""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT 
-                    h.bill_id,
-                    h.patient_name,
-                    COUNT(*) as his_services
-                FROM his h
-                LEFT JOIN ris r ON h.bill_id = r.patient_id
-                WHERE r.patient_id IS NULL
-                GROUP BY h.bill_id, h.patient_name
-            """))
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        result = conn.execute(_SQL_MISSING_IN_RIS)
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/analytics/service-mismatch")
-def service_mismatch():
+@cached_response
+def service_mismatch(stream: bool = False, conn: Connection = Depends(get_conn)):
     """Query 4: Service Count Mismatch"""
+    if stream:
+        return _ndjson_response(_SQL_SERVICE_MISMATCH)
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT 
-                    h.bill_id,
-                    h.patient_name as his_name,
-                    COUNT(DISTINCT h.id) as his_count,
-                    r.patient as ris_name,
-                    COUNT(DISTINCT r.id) as ris_count,
-                    ABS(COUNT(DISTINCT h.id) - COUNT(DISTINCT r.id)) as difference
-                FROM his h
-                LEFT JOIN ris r ON h.bill_id = r.patient_id
-                GROUP BY h.bill_id, h.patient_name, r.patient
-                HAVING COUNT(DISTINCT h.id) != COUNT(DISTINCT r.id)
-                ORDER BY difference DESC
-            """))
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        result = conn.execute(_SQL_SERVICE_MISMATCH)
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/analytics/daily-trends")
-def daily_trends():
+@cached_response
+def daily_trends(stream: bool = False, conn: Connection = Depends(get_conn)):
     """Query 5: Daily Service Trends"""
+    if stream:
+        return _ndjson_response(_SQL_DAILY_TRENDS)
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT 
-                    bill_date as date,
-                    COUNT(*) as total_services,
-                    COUNT(DISTINCT bill_id) as unique_patients,
-                    COUNT(DISTINCT service_description) as service_types
-                FROM his
-                GROUP BY bill_date
-                ORDER BY bill_date DESC
-            """))
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        result = conn.execute(_SQL_DAILY_TRENDS)
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/analytics/top-services")
-def top_services():
+@cached_response
+def top_services(conn: Connection = Depends(get_conn)):
     """Query 6: Top Services"""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT 
-                    service_description,
-                    COUNT(*) as count,
-                    COUNT(DISTINCT bill_id) as unique_patients
-                FROM his
-                GROUP BY service_description
-                ORDER BY count DESC
-                LIMIT 20
-            """))
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        result = conn.execute(_SQL_TOP_SERVICES)
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 @app.get("/analytics/service-comparison")
-def service_comparison(patient_name: str = ""):
+@cached_response
+def service_comparison(patient_name: str = "", conn: Connection = Depends(get_conn)):
     """Query 7: Service Comparison - HIS vs RIS side by side"""
     try:
-        with engine.connect() as conn:
-            # Base query - join HIS and RIS on bill_id = patient_id
-            base_query = """
-                SELECT 
-                    COALESCE(h.bill_id, r.patient_id) as id,
-                    COALESCE(h.patient_name, r.patient) as patient_name,
-                    h.patient_name as his_patient_name,
-                    r.patient as ris_patient_name,
-                    STRING_AGG(DISTINCT h.service_description, ' | ') as his_services,
-                    STRING_AGG(DISTINCT r.test_name, ' | ') as ris_services,
-                    COUNT(DISTINCT h.id) as his_service_count,
-                    COUNT(DISTINCT r.id) as ris_service_count
-                FROM his h
-                FULL OUTER JOIN ris r ON h.bill_id = r.patient_id
-            """
+        # Base query - join HIS and RIS on bill_id = patient_id
+        base_query = """
+            SELECT 
+                COALESCE(h.bill_id, r.patient_id) as id,
+                COALESCE(h.patient_name, r.patient) as patient_name,
+                h.patient_name as his_patient_name,
+                r.patient as ris_patient_name,
+                STRING_AGG(DISTINCT h.service_description, ' | ') as his_services,
+                STRING_AGG(DISTINCT r.test_name, ' | ') as ris_services,
+                COUNT(DISTINCT h.id) as his_service_count,
+                COUNT(DISTINCT r.id) as ris_service_count
+            FROM his h
+            FULL OUTER JOIN ris r ON h.bill_id = r.patient_id
+        """
             
-            # Add filter if patient name provided
-            if patient_name:
-                base_query += """
-                WHERE LOWER(h.patient_name) LIKE LOWER(:pattern) 
-                   OR LOWER(r.patient) LIKE LOWER(:pattern)
-                """
-                result = conn.execute(
-                    text(base_query + """
-                        GROUP BY h.bill_id, r.patient_id, h.patient_name, r.patient
-                        ORDER BY patient_name
-                    """),
-                    {"pattern": f"%{patient_name}%"}
-                )
-            else:
-                result = conn.execute(text(base_query + """
+        # Add filter if patient name provided
+        if patient_name:
+            base_query += """
+            WHERE LOWER(h.patient_name) LIKE LOWER(:pattern) 
+               OR LOWER(r.patient) LIKE LOWER(:pattern)
+            """
+            result = conn.execute(
+                text(base_query + """
                     GROUP BY h.bill_id, r.patient_id, h.patient_name, r.patient
                     ORDER BY patient_name
-                    LIMIT 100
-                """))
+                """),
+                {"pattern": f"%{patient_name}%"}
+            )
+        else:
+            result = conn.execute(text(base_query + """
+                GROUP BY h.bill_id, r.patient_id, h.patient_name, r.patient
+                ORDER BY patient_name
+                LIMIT 100
+            """))
             
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/analytics/patient-search")
-def patient_search(query: str):
+@cached_response
+def patient_search(query: str, conn: Connection = Depends(get_conn)):
     """Search for patients by name across both tables"""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT DISTINCT 
-                    COALESCE(h.patient_name, r.patient) as patient_name,
-                    COALESCE(h.bill_id, r.patient_id) as patient_id
-                FROM his h
-                FULL OUTER JOIN ris r ON h.bill_id = r.patient_id
-                WHERE LOWER(h.patient_name) LIKE LOWER(:pattern)
-                   OR LOWER(r.patient) LIKE LOWER(:pattern)
-                ORDER BY patient_name
-                LIMIT 50
-            """), {"pattern": f"%{query}%"})
+        result = conn.execute(text("""
+            SELECT DISTINCT 
+                COALESCE(h.patient_name, r.patient) as patient_name,
+                COALESCE(h.bill_id, r.patient_id) as patient_id
+            FROM his h
+            FULL OUTER JOIN ris r ON h.bill_id = r.patient_id
+            WHERE LOWER(h.patient_name) LIKE LOWER(:pattern)
+               OR LOWER(r.patient) LIKE LOWER(:pattern)
+            ORDER BY patient_name
+            LIMIT 50
+        """), {"pattern": f"%{query}%"})
             
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/analytics/order-type-modality-comparison")
-def order_type_modality_comparison():
+@cached_response
+def order_type_modality_comparison(conn: Connection = Depends(get_conn)):
     """Compare Order Type and Modality across RIS and Scan files"""
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT 
-                    COALESCE(r.patient_id, s.patient_id) as patient_id,
-                    COALESCE(r.patient, s.patient) as patient_name,
-                    r.order_type as ris_order_type,
-                    s.order_type as scan_order_type,
-                    r.modality as ris_modality,
-                    s.modality as scan_modality,
-                    CASE 
-                        WHEN r.order_type = s.order_type THEN 'Match'
-                        ELSE 'Mismatch'
-                    END as order_type_status,
-                    CASE 
-                        WHEN r.modality = s.modality THEN 'Match'
-                        ELSE 'Mismatch'
-                    END as modality_status
-                FROM ris r
-                FULL OUTER JOIN scan_detail s ON r.patient_id = s.patient_id
-                WHERE r.patient_id IS NOT NULL OR s.patient_id IS NOT NULL
-                ORDER BY patient_name
-                LIMIT 100
-            """))
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        result = conn.execute(text("""
+            SELECT 
+                COALESCE(r.patient_id, s.patient_id) as patient_id,
+                COALESCE(r.patient, s.patient) as patient_name,
+                r.order_type as ris_order_type,
+                s.order_type as scan_order_type,
+                r.modality as ris_modality,
+                s.modality as scan_modality,
+                CASE 
+                    WHEN r.order_type = s.order_type THEN 'Match'
+                    ELSE 'Mismatch'
+                END as order_type_status,
+                CASE 
+                    WHEN r.modality = s.modality THEN 'Match'
+                    ELSE 'Mismatch'
+                END as modality_status
+            FROM ris r
+            FULL OUTER JOIN scan_detail s ON r.patient_id = s.patient_id
+            WHERE r.patient_id IS NOT NULL OR s.patient_id IS NOT NULL
+            ORDER BY patient_name
+            LIMIT 100
+        """))
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/analytics/worklist-details")
-def worklist_details(patient_name: str = ""):
+@cached_response
+def worklist_details(patient_name: str = "", conn: Connection = Depends(get_conn)):
     """Get worklist information: Study, Institution, Study Time, Assigned To"""
     try:
-        with engine.connect() as conn:
-            base_query = """
-                SELECT 
-                    patient_id,
-                    patient_name,
-                    study,
-                    institution_name,
-                    study_time,
-                    assigned_to,
-                    report_finalized_by,
-                    report as report_status,
-                    study_date
-                FROM worklist
-            """
+        base_query = """
+            SELECT 
+                patient_id,
+                patient_name,
+                study,
+                institution_name,
+                study_time,
+                assigned_to,
+                report_finalized_by,
+                report as report_status,
+                study_date
+            FROM worklist
+        """
             
-            if patient_name:
-                base_query += " WHERE LOWER(patient_name) LIKE LOWER(:pattern)"
-                result = conn.execute(
-                    text(base_query + " ORDER BY study_date DESC, study_time DESC LIMIT 100"),
-                    {"pattern": f"%{patient_name}%"}
-                )
-            else:
-                result = conn.execute(text(base_query + " ORDER BY study_date DESC, study_time DESC LIMIT 100"))
+        if patient_name:
+            base_query += " WHERE LOWER(patient_name) LIKE LOWER(:pattern)"
+            result = conn.execute(
+                text(base_query + " ORDER BY study_date DESC, study_time DESC LIMIT 100"),
+                {"pattern": f"%{patient_name}%"}
+            )
+        else:
+            result = conn.execute(text(base_query + " ORDER BY study_date DESC, study_time DESC LIMIT 100"))
             
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/analytics/comprehensive-patient-view")
-def comprehensive_patient_view(patient_name: str = ""):
+@cached_response
+def comprehensive_patient_view(patient_name: str = "", conn: Connection = Depends(get_conn)):
     """
     Comprehensive view combining HIS, RIS, Scan Detail, and Worklist
     """
     try:
-        with engine.connect() as conn:
-            base_query = """
-                SELECT 
-                    COALESCE(h.bill_id, r.patient_id, s.patient_id, w.patient_id) as patient_id,
-                    COALESCE(h.patient_name, r.patient, s.patient, w.patient_name) as patient_name,
+        base_query = """
+            SELECT 
+                COALESCE(h.bill_id, r.patient_id, s.patient_id, w.patient_id) as patient_id,
+                COALESCE(h.patient_name, r.patient, s.patient, w.patient_name) as patient_name,
                     
-                    -- HIS Info
-                    STRING_AGG(DISTINCT h.service_description, ' | ') as his_services,
-                    COUNT(DISTINCT h.id) as his_service_count,
+                -- HIS Info
+                STRING_AGG(DISTINCT h.service_description, ' | ') as his_services,
+                COUNT(DISTINCT h.id) as his_service_count,
                     
-                    -- RIS Info
-                    r.order_type as ris_order_type,
-                    r.modality as ris_modality,
-                    STRING_AGG(DISTINCT r.test_name, ' | ') as ris_tests,
-                    COUNT(DISTINCT r.id) as ris_test_count,
+                -- RIS Info
+                r.order_type as ris_order_type,
+                r.modality as ris_modality,
+                STRING_AGG(DISTINCT r.test_name, ' | ') as ris_tests,
+                COUNT(DISTINCT r.id) as ris_test_count,
                     
-                    -- Scan Detail Info
-                    s.order_type as scan_order_type,
-                    s.modality as scan_modality,
-                    s.scan_status,
-                    s.order_status,
+                -- Scan Detail Info
+                s.order_type as scan_order_type,
+                s.modality as scan_modality,
+                s.scan_status,
+                s.order_status,
                     
-                    -- Worklist Info
-                    w.study,
-                    w.institution_name,
-                    w.study_time,
-                    w.assigned_to,
-                    w.report_finalized_by,
-                    w.report as report_status
+                -- Worklist Info
+                w.study,
+                w.institution_name,
+                w.study_time,
+                w.assigned_to,
+                w.report_finalized_by,
+                w.report as report_status
                     
-                FROM his h
-                FULL OUTER JOIN ris r ON h.bill_id = r.patient_id
-                FULL OUTER JOIN scan_detail s ON COALESCE(h.bill_id, r.patient_id) = s.patient_id
-                FULL OUTER JOIN worklist w ON COALESCE(h.bill_id, r.patient_id, s.patient_id) = w.patient_id
-            """
+            FROM his h
+            FULL OUTER JOIN ris r ON h.bill_id = r.patient_id
+            FULL OUTER JOIN scan_detail s ON COALESCE(h.bill_id, r.patient_id) = s.patient_id
+            FULL OUTER JOIN worklist w ON COALESCE(h.bill_id, r.patient_id, s.patient_id) = w.patient_id
+        """
             
-            if patient_name:
-                base_query += """
-                WHERE LOWER(h.patient_name) LIKE LOWER(:pattern)
-                   OR LOWER(r.patient) LIKE LOWER(:pattern)
-                   OR LOWER(s.patient) LIKE LOWER(:pattern)
-                   OR LOWER(w.patient_name) LIKE LOWER(:pattern)
-                """
-                result = conn.execute(
-                    text(base_query + """
-                        GROUP BY h.bill_id, r.patient_id, s.patient_id, w.patient_id,
-                                 h.patient_name, r.patient, s.patient, w.patient_name,
-                                 r.order_type, r.modality, s.order_type, s.modality, 
-                                 s.scan_status, s.order_status, w.study, w.institution_name,
-                                 w.study_time, w.assigned_to, w.report_finalized_by, w.report
-                        ORDER BY patient_name
-                        LIMIT 50
-                    """),
-                    {"pattern": f"%{patient_name}%"}
-                )
-            else:
-                result = conn.execute(text(base_query + """
+        if patient_name:
+            base_query += """
+            WHERE LOWER(h.patient_name) LIKE LOWER(:pattern)
+               OR LOWER(r.patient) LIKE LOWER(:pattern)
+               OR LOWER(s.patient) LIKE LOWER(:pattern)
+               OR LOWER(w.patient_name) LIKE LOWER(:pattern)
+            """
+            result = conn.execute(
+                text(base_query + """
                     GROUP BY h.bill_id, r.patient_id, s.patient_id, w.patient_id,
                              h.patient_name, r.patient, s.patient, w.patient_name,
                              r.order_type, r.modality, s.order_type, s.modality, 
@@ -946,11 +1472,20 @@ def comprehensive_patient_view(patient_name: str = ""):
                              w.study_time, w.assigned_to, w.report_finalized_by, w.report
                     ORDER BY patient_name
                     LIMIT 50
-                """))
+                """),
+                {"pattern": f"%{patient_name}%"}
+            )
+        else:
+            result = conn.execute(text(base_query + """
+                GROUP BY h.bill_id, r.patient_id, s.patient_id, w.patient_id,
+                         h.patient_name, r.patient, s.patient, w.patient_name,
+                         r.order_type, r.modality, s.order_type, s.modality, 
+                         s.scan_status, s.order_status, w.study, w.institution_name,
+                         w.study_time, w.assigned_to, w.report_finalized_by, w.report
+                ORDER BY patient_name
+                LIMIT 50
+            """))
             
-            rows = result.fetchall()
-            columns = result.keys()
-        
-        return {"data": [dict(zip(columns, row)) for row in rows]}
+        return {"data": [dict(m) for m in result.mappings()]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,249 @@
+from functools import lru_cache
+from sqlalchemy import create_engine, text, inspect
+from sqlalchemy.pool import NullPool
+import hashlib
+import json
+import os
+import time
+
+from app.config import settings
+
+# Database connection
+_engine_kwargs = dict(
+    pool_pre_ping=True,
+    # Session-level guards applied at connect time instead of a SET
+    # round-trip before every user query
+    connect_args={"options": "-c statement_timeout=30000 -c lock_timeout=5000"},
+    echo=settings.SQLALCHEMY_ECHO,
+    future=True,
+)
+if settings.POOL_MODE == "null":
+    _engine_kwargs["poolclass"] = NullPool
+else:
+    _engine_kwargs.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_use_lifo=True,
+    )
+engine = create_engine(settings.database_url, **_engine_kwargs)
+
+# Last raw ping, coalesced so health-check loops don't stack probes
+_last_ping = {"ts": 0.0, "ok": False}
+
+def test_connection() -> bool:
+    """Ping the database on a pooled raw connection, no transaction setup"""
+    now = time.monotonic()
+    if _last_ping["ok"] and now - _last_ping["ts"] < 1.0:
+        return True
+    try:
+        raw = engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+        finally:
+            raw.close()
+        _last_ping.update(ts=now, ok=True)
+        return True
+    except Exception:
+        _last_ping.update(ts=now, ok=False)
+        return False
+
+def get_conn():
+    """Yield a pooled connection for the duration of a request"""
+    with engine.connect() as conn:
+        yield conn
+
+# Schema metadata cache: rebuilt lazily, refreshed after the TTL expires
+# and invalidated explicitly by the DDL endpoints (/upload-csv, DELETE /table)
+_SCHEMA_TTL = 300
+_schema_state = {"tables": None, "columns": None, "info": None,
+                 "schema_text": None, "schema_blocks": None, "ts": 0.0}
+
+@lru_cache(maxsize=1)
+def _inspector():
+    """Single shared Inspector; cleared together with the schema cache"""
+    return inspect(engine)
+
+# Rendered schema block persisted across process restarts, keyed by a
+# signature of the table list; a cold start that finds a matching file
+# skips the whole column-introspection pass
+_SCHEMA_CACHE_FILE = "/tmp/hospital_schema_cache.json"
+
+def _schema_signature(tables) -> str:
+    return hashlib.sha1(repr(sorted(tables)).encode()).hexdigest()
+
+def _load_schema_text_from_disk(tables):
+    try:
+        with open(_SCHEMA_CACHE_FILE) as f:
+            cached = json.load(f)
+        if cached.get("sig") == _schema_signature(tables):
+            return cached.get("schema_text")
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _store_schema_text_to_disk(tables, schema_text):
+    try:
+        with open(_SCHEMA_CACHE_FILE, "w") as f:
+            json.dump({"sig": _schema_signature(tables), "schema_text": schema_text}, f)
+    except OSError:
+        pass
+
+def invalidate_schema_cache():
+    """Force the next schema read to re-introspect the database"""
+    _inspector.cache_clear()
+    _schema_state.update(tables=None, columns=None, info=None,
+                         schema_text=None, schema_blocks=None, ts=0.0)
+    # The table list alone does not capture column changes, so any DDL
+    # event also drops the persisted copy
+    try:
+        os.unlink(_SCHEMA_CACHE_FILE)
+    except OSError:
+        pass
+
+def get_cached_table_names():
+    """Return the cached table list, re-inspecting only when stale"""
+    now = time.monotonic()
+    if _schema_state["tables"] is None or now - _schema_state["ts"] > _SCHEMA_TTL:
+        _inspector.cache_clear()
+        _schema_state["tables"] = _inspector().get_table_names()
+        _schema_state["columns"] = None
+        _schema_state["info"] = None
+        _schema_state["schema_text"] = None
+        _schema_state["schema_blocks"] = None
+        _schema_state["ts"] = now
+    return _schema_state["tables"]
+
+def get_cached_table_columns():
+    """Per-table column dicts, sliced out of the grouped catalog pass so a
+    cold build costs three queries total instead of one get_columns round-trip
+    per table"""
+    if _schema_state["columns"] is None:
+        _schema_state["columns"] = {
+            table: info["columns"] for table, info in get_all_table_info().items()
+        }
+    return _schema_state["columns"]
+
+def table_exists(table_name: str) -> bool:
+    """O(1) existence check against the cached table list"""
+    return table_name in get_cached_table_names()
+
+def get_all_table_info():
+    """Columns, PKs, FKs and indexes for every table in three grouped catalog queries"""
+    tables = get_cached_table_names()
+    if _schema_state["info"] is None:
+        info = {t: {"columns": [], "primary_keys": [], "foreign_keys": [], "indexes": []}
+                for t in tables}
+        with engine.connect() as conn:
+            columns = conn.execute(text("""
+                SELECT table_name, column_name, data_type, is_nullable
+                FROM information_schema.columns
+                WHERE table_schema = current_schema()
+                ORDER BY table_name, ordinal_position
+            """))
+            for row in columns:
+                if row.table_name in info:
+                    info[row.table_name]["columns"].append({
+                        "name": row.column_name,
+                        "type": row.data_type,
+                        "nullable": row.is_nullable == "YES",
+                    })
+
+            constraints = conn.execute(text("""
+                SELECT c.relname AS table_name,
+                       con.conname AS name,
+                       con.contype::text AS contype,
+                       pg_get_constraintdef(con.oid) AS definition
+                FROM pg_constraint con
+                JOIN pg_class c ON c.oid = con.conrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = current_schema() AND con.contype IN ('p', 'f')
+            """))
+            for row in constraints:
+                if row.table_name in info:
+                    bucket = "primary_keys" if row.contype == "p" else "foreign_keys"
+                    info[row.table_name][bucket].append({
+                        "name": row.name,
+                        "definition": row.definition,
+                    })
+
+            indexes = conn.execute(text("""
+                SELECT tablename, indexname, indexdef
+                FROM pg_indexes
+                WHERE schemaname = current_schema()
+            """))
+            for row in indexes:
+                if row.tablename in info:
+                    info[row.tablename]["indexes"].append({
+                        "name": row.indexname,
+                        "definition": row.indexdef,
+                    })
+        _schema_state["info"] = info
+    return _schema_state["info"]
+
+def quote_ident(name: str) -> str:
+    """Quote one identifier for SQL interpolation, doubling embedded quotes -
+    catalog names can be digit-leading, uppercase or reserved words"""
+    return '"%s"' % name.replace('"', '""')
+
+def safe_table(table_name: str) -> str:
+    """Resolve table_name via to_regclass and return it quoted for interpolation"""
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass(:n)"), {"n": table_name}).scalar() is None:
+            raise ValueError(f"Unknown table: {table_name}")
+    return quote_ident(table_name)
+
+def get_table_row_count(table_name: str, exact: bool = False) -> int:
+    """Row count for a table - planner estimate unless exact is requested"""
+    with engine.connect() as conn:
+        if not exact:
+            estimate = conn.execute(
+                text("SELECT reltuples::BIGINT FROM pg_class WHERE oid = to_regclass(:t)"),
+                {"t": table_name},
+            ).scalar()
+            if estimate is not None and estimate >= 0:
+                return estimate
+        # exact=True, or the planner has never analyzed the table
+        return conn.execute(text(f"SELECT COUNT(*) FROM {safe_table(table_name)}")).scalar()
+
+@lru_cache(maxsize=256)
+def _sample_statement(quoted_table: str):
+    """One text() clause per table so the compiled-statement cache can hit"""
+    return text(f"SELECT * FROM {quoted_table} LIMIT :lim")
+
+def get_table_sample(table_name: str, limit: int = 5):
+    """First rows of a table as plain dicts, with the identifier safely quoted"""
+    statement = _sample_statement(safe_table(table_name))
+    with engine.connect() as conn:
+        result = conn.execute(statement, {"lim": int(limit)})
+        return [dict(m) for m in result.mappings().fetchmany(int(limit))]
+
+def get_schema_blocks():
+    """Per-table CREATE TABLE blocks, so prompts can include only the tables
+    a question actually touches instead of the whole schema"""
+    if _schema_state["schema_blocks"] is None:
+        blocks = {}
+        for table, columns in get_cached_table_columns().items():
+            col_definitions = []
+            for col in columns:
+                col_type = "TEXT" if col['name'] != 'id' else "BIGINT"
+                col_definitions.append(f"  {col['name']} {col_type}")
+            blocks[table] = f"CREATE TABLE {table} (\n" + ",\n".join(col_definitions) + "\n);\n\n"
+        _schema_state["schema_blocks"] = blocks
+    return _schema_state["schema_blocks"]
+
+def get_schema_text():
+    """CREATE TABLE-style schema block for the LLM prompt, built once per schema change"""
+    if _schema_state["schema_text"] is None:
+        tables = get_cached_table_names()
+        cached = _load_schema_text_from_disk(tables)
+        if cached is not None:
+            _schema_state["schema_text"] = cached
+            return cached
+        schema_info = "".join(get_schema_blocks().values())
+        _schema_state["schema_text"] = schema_info
+        _store_schema_text_to_disk(tables, schema_info)
+    return _schema_state["schema_text"]
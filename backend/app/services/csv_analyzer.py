@@ -0,0 +1,247 @@
+import csv
+import hashlib
+import io
+import logging
+import threading
+
+from cachetools import LRUCache
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from app.services.data_loader import clean_dataframe
+
+logger = logging.getLogger("hospital.csv_analyzer")
+
+# Tokens that show up in the header rows of the hospital exports
+_HEADER_KEYWORDS = frozenset((
+    "name", "id", "date", "time", "patient", "bill", "service",
+    "type", "status", "no", "code", "modality", "study", "report",
+))
+
+# Analyses keyed by a blake2b digest of the decoded head: the UI hits
+# /analyze-csv and then /upload-csv with the same bytes back to back, so
+# the second and later passes should cost a hash, not a re-scan.
+# LRUCache mutates recency state on reads, so concurrent threadpool
+# callers must hold the lock for every access
+_ANALYSIS_CACHE = LRUCache(maxsize=32)
+_ANALYSIS_CACHE_LOCK = threading.Lock()
+
+# Per-row score components: no-numeric-cells +3, keywords +3, underscores +2,
+# all-unique +2, width-matches-data +2; numeric cells subtract 2
+_MAX_SCORE = 12
+
+# A row at or above this can only be beaten by a near-perfect later row;
+# in practice the header is the first row to score this high
+_EARLY_EXIT_SCORE = 10
+
+
+# Bytes that may appear in a formatted number - digits plus separators,
+# sign, exponent and padding; deleted in one C translate pass
+_NUMERIC_BYTES = b'0123456789.,-eE+ '
+_NUMERIC_PUNCT = b'.,-eE+ '
+
+
+def _is_numeric_cell(cell: str) -> bool:
+    """True for cells that are just a (formatted) number - data, not a header"""
+    encoded = cell.encode('ascii', 'ignore')
+    # Anything surviving the numeric-byte mask disqualifies the cell; the
+    # second translate leaves just the digits (empty -> isdigit() False)
+    if encoded.translate(None, _NUMERIC_BYTES):
+        return False
+    return encoded.translate(None, _NUMERIC_PUNCT).isdigit()
+
+
+class CSVAnalyzer:
+    """Preview-window analysis of an uploaded CSV: find the header row so the
+    frontend can pre-fill skip_rows instead of making the user count lines"""
+
+    PREVIEW_LINES = 20
+
+    # Header detection only looks at the preview window; 64 KiB comfortably
+    # holds 20 lines of any reasonable CSV, so never decode more than that
+    HEAD_BYTES = 1 << 16
+
+    def analyze_file(self, file_content, preview_lines: int = PREVIEW_LINES) -> dict:
+        """Header detection plus a small preview of the first rows.
+
+        Accepts raw bytes or a file-like object (e.g. the upload's spooled
+        temp file), so callers never have to materialize the body first.
+        Only the first 64 KiB is decoded regardless of upload size.
+        """
+        if hasattr(file_content, "read"):
+            head = file_content.read(self.HEAD_BYTES)
+        else:
+            head = file_content[:self.HEAD_BYTES]
+
+        # blake2b over <=64 KiB is microseconds; a hit skips the whole scan
+        cache_key = (hashlib.blake2b(head, digest_size=16).digest(), preview_lines)
+        with _ANALYSIS_CACHE_LOCK:
+            cached = _ANALYSIS_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
+        content_str = head.decode('utf-8', errors='ignore')
+        lines = content_str.splitlines()
+        if len(head) == self.HEAD_BYTES:
+            # The cap probably cut mid-line; drop the truncated tail
+            lines = lines[:-1]
+        lines = lines[:preview_lines]
+        # One csv.reader pass over the whole preview window
+        rows = [row for row in csv.reader(io.StringIO('\n'.join(lines)))]
+        if not rows:
+            analysis = {"header_row": 0, "skip_rows": 0, "confidence": 0.0,
+                        "reasons": [], "columns": [], "preview": []}
+        else:
+            header_row, confidence, reasons = self._detect_header_row(rows)
+            analysis = {
+                "header_row": header_row,
+                "skip_rows": header_row,
+                "confidence": confidence,
+                "reasons": reasons,
+                "columns": rows[header_row],
+                "preview": rows[:10],
+            }
+        with _ANALYSIS_CACHE_LOCK:
+            _ANALYSIS_CACHE[cache_key] = analysis
+        return analysis
+
+    # Above this size /column-stats streams the file chunk-wise instead of
+    # materializing one DataFrame for a single pass of counting
+    CHUNKED_STATS_BYTES = 50 * 1024 * 1024
+    STATS_CHUNK_ROWS = 100_000
+
+    def column_statistics(self, file_content, skip_rows: int = 0) -> list:
+        """Parse with inferred dtypes (stats need real types, unlike the
+        TEXT-only load path) and compute the per-column statistics"""
+        if isinstance(file_content, (bytes, bytearray)):
+            size = len(file_content)
+            file_content = io.BytesIO(file_content)
+        else:
+            file_content.seek(0, io.SEEK_END)
+            size = file_content.tell()
+            file_content.seek(0)
+        if size > self.CHUNKED_STATS_BYTES:
+            return self._chunked_column_statistics(file_content, skip_rows)
+        df = pd.read_csv(file_content, skiprows=skip_rows)
+        return self.get_column_statistics(df)
+
+    def _chunked_column_statistics(self, buf, skip_rows: int) -> list:
+        """Bounded-memory stats for large files: running null counts plus
+        sets of 64-bit value hashes per column, aggregated chunk by chunk"""
+        total = 0
+        nulls = {}
+        seen = {}
+        dtypes = {}
+        for chunk in pd.read_csv(buf, skiprows=skip_rows,
+                                 chunksize=self.STATS_CHUNK_ROWS):
+            total += len(chunk)
+            # Whole-frame reductions produce native ints in one vectorized
+            # pass each; no per-column Series calls or scalar casts
+            for col, n in chunk.isna().sum().to_dict().items():
+                nulls[col] = nulls.get(col, 0) + n
+            dtypes.update(chunk.dtypes.astype(str).to_dict())
+            for col in chunk.columns:
+                # Distinct counting over 64-bit hashes keeps ~32 bytes per
+                # distinct value no matter how wide the raw strings are
+                seen.setdefault(col, set()).update(
+                    pd.util.hash_array(
+                        chunk[col].dropna().astype(str).to_numpy()
+                    ).tolist()
+                )
+        return [{
+            "name": col,
+            "dtype": dtypes[col],
+            "total_count": total,
+            "null_count": nulls[col],
+            "unique_count": len(seen[col]),
+            "is_unique": nulls[col] == 0 and len(seen[col]) == total,
+        } for col in nulls]
+
+    def get_column_statistics(self, df: pd.DataFrame) -> list:
+        """Null/unique counts per column for primary-key probing.
+
+        Runs on Arrow compute kernels - one vectorized C++ scan per column
+        instead of a pandas nunique/isnull hash pass each.
+        """
+        # inf -> NaN and artifact-column removal happen in the shared
+        # fused pass before the frame crosses into Arrow
+        df = clean_dataframe(df)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        total = table.num_rows
+        stats = []
+        for name, column in zip(table.column_names, table.columns):
+            null_count = pc.count(column, mode="only_null").as_py()
+            unique_count = pc.count_distinct(column, mode="only_valid").as_py()
+            stats.append({
+                "name": name,
+                "dtype": str(column.type),
+                "total_count": total,
+                "null_count": null_count,
+                "unique_count": unique_count,
+                "is_unique": null_count == 0 and unique_count == total,
+            })
+        return stats
+
+    @staticmethod
+    def _row_features(row):
+        """Header-likeness features of one row: (clean, keyword, underscore,
+        unique, numeric_cells)"""
+        filled = [cell.strip().lower() for cell in row if cell.strip()]
+        numeric_cells = sum(_is_numeric_cell(cell) for cell in row)
+        return (
+            numeric_cells == 0 and len(filled) >= 2,
+            any(any(k in cell for k in _HEADER_KEYWORDS) for cell in filled),
+            any('_' in cell for cell in row),
+            bool(filled) and len(set(filled)) == len(filled),
+            numeric_cells,
+        )
+
+    def _detect_header_row(self, rows):
+        """Score preview rows on header-likeness, stopping early once a
+        clear winner has emerged.
+
+        Row widths are known before any cell scan, so the per-cell feature
+        pass runs row by row and breaks as soon as some row has scored
+        _EARLY_EXIT_SCORE with a couple of rows of lookahead behind it -
+        on a typical export only the first few rows are ever scanned.
+        """
+        n = len(rows)
+        widths = np.array([len(row) for row in rows], dtype=np.int32)
+        width_match = np.zeros(n, dtype=bool)
+        for i in range(n - 1):
+            width_match[i] = widths[i] == np.bincount(widths[i + 1:]).argmax()
+
+        best = 0
+        best_score = None
+        best_features = None
+        for i, row in enumerate(rows):
+            clean, keyword, underscore, unique, numeric_cells = self._row_features(row)
+            score = (3 * clean - 2 * (not clean and numeric_cells > 0)
+                     + 3 * keyword + 2 * underscore + 2 * unique
+                     + 2 * int(width_match[i]))
+            if best_score is None or score > best_score:
+                best, best_score = i, score
+                best_features = (clean, keyword, underscore, unique)
+            if best_score >= _EARLY_EXIT_SCORE and i >= 2:
+                break
+
+        # Reasons are only materialized for the winning row
+        clean, keyword, underscore, unique = best_features
+        reasons = []
+        if clean:
+            reasons.append("no numeric cells")
+        if keyword:
+            reasons.append("header keywords present")
+        if underscore:
+            reasons.append("underscored names")
+        if unique:
+            reasons.append("all cells unique")
+        if width_match[best]:
+            reasons.append("column count matches the data below")
+        confidence = round(max(best_score, 0) / _MAX_SCORE, 2)
+        return best, confidence, reasons
+
+
+csv_analyzer = CSVAnalyzer()
@@ -0,0 +1,208 @@
+import io
+import logging
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from app.models.database import engine, quote_ident
+
+logger = logging.getLogger("hospital.data_loader")
+
+# Column-name normalizer: one C-level pass mapping ' ', '/' and '.' to '_'
+_COL_TRANS = str.maketrans({' ': '_', '/': '_', '.': '_'})
+
+# Anything left that isn't a word character after the translate pass
+_SANITIZE_RE = re.compile(r'[^\w]')
+
+# Join keys and GROUP BY columns the analytics queries depend on;
+# indexed at upload time whenever the CSV carries them
+_INDEXED_COLUMNS = ("bill_id", "patient_id", "service_description", "bill_date")
+
+
+def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """One fused cleaning pass shared by the load and stats paths.
+
+    inf folded into NaN, all-empty rows dropped, blank/'Unnamed' artifact
+    columns removed, header whitespace stripped - done in place so the
+    frame is rewritten once instead of copied per step.
+    """
+    # inf can only live in float columns; the dtype=str load path and any
+    # int/string column skip the replace scan entirely
+    float_cols = df.select_dtypes(include='float').columns
+    if len(float_cols):
+        df[float_cols] = df[float_cols].replace([np.inf, -np.inf], np.nan)
+    df.dropna(how='all', inplace=True)
+    # Blank header cells are trailing-comma artifacts: the C engine names
+    # them 'Unnamed: N', pyarrow leaves them empty
+    keep = ~(df.columns.str.startswith('Unnamed') | (df.columns == ''))
+    if not keep.all():
+        df = df.loc[:, keep]
+    df.columns = df.columns.str.strip()
+    return df
+
+
+@lru_cache(maxsize=4096)
+def _sanitize_column_name(name: str) -> str:
+    """Normalize one header cell into a safe identifier; memoized because
+    the same export headers arrive upload after upload"""
+    name = name.strip().lower().translate(_COL_TRANS)
+    # The translate table covers the common separators; the regex only
+    # runs when something stranger ('(', '%', unicode) survived it
+    return _SANITIZE_RE.sub('_', name) if _SANITIZE_RE.search(name) else name
+
+
+class DataLoader:
+    """CSV-to-table ingest: parse the bytes exactly once, normalize the
+    columns, recreate the table and bulk-load it via COPY"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def parse_csv(self, buf, skip_rows: int = 0) -> pd.DataFrame:
+        """Parse CSV bytes or a file-like object into an all-TEXT DataFrame"""
+        if isinstance(buf, (bytes, bytearray)):
+            buf = io.BytesIO(buf)
+
+        # Everything lands as TEXT anyway - skip type inference and read
+        # straight into strings, treating only empty fields as missing
+        read_kwargs = dict(
+            skiprows=skip_rows,
+            dtype=str,
+            keep_default_na=False,
+            na_values=[''],
+        )
+        try:
+            # pyarrow's multi-threaded SIMD parser; it rejects ragged
+            # preamble rows, so the C parser stays as the fallback
+            df = pd.read_csv(buf, engine='pyarrow', **read_kwargs)
+        except (ValueError, pd.errors.ParserError):
+            df = None
+            if skip_rows:
+                # Ragged preamble rows are what usually break pyarrow; slice
+                # them off at the byte level and retry before surrendering
+                # the multi-threaded parser for the single-core C engine
+                buf.seek(0)
+                body = buf.read()
+                offset = 0
+                for _ in range(skip_rows):
+                    newline = body.find(b"\n", offset)
+                    if newline == -1:
+                        offset = len(body)
+                        break
+                    offset = newline + 1
+                try:
+                    df = pd.read_csv(io.BytesIO(body[offset:]), engine='pyarrow',
+                                     **dict(read_kwargs, skiprows=0))
+                except (ValueError, pd.errors.ParserError):
+                    df = None
+            if df is None:
+                buf.seek(0)
+                df = pd.read_csv(buf, engine='c', **read_kwargs)
+
+        df = clean_dataframe(df)
+        df.columns = df.columns.map(_sanitize_column_name)
+        return df
+
+    def load_csv_data(self, table_name: str, file_content=None, *,
+                      df: pd.DataFrame = None, skip_rows: int = 0) -> pd.DataFrame:
+        """Load a CSV into table_name and return the DataFrame that was loaded.
+
+        Callers that already parsed the bytes pass the DataFrame via df so the
+        file is tokenized exactly once per request; the bytes path stays for
+        anyone without a pre-parsed frame.
+        """
+        if df is None:
+            df = self.parse_csv(file_content, skip_rows=skip_rows)
+        self._load_dataframe(df, table_name)
+        return df
+
+    def _load_dataframe(self, df: pd.DataFrame, table_name: str):
+        """Recreate table_name from df and bulk-load it via COPY"""
+        column_ddl = ", ".join(f"{quote_ident(col)} TEXT" for col in df.columns)
+        column_list = ", ".join(quote_ident(col) for col in df.columns)
+        index_ddl = [
+            f"CREATE INDEX IF NOT EXISTS {table_name}_{col}_idx "
+            f"ON {table_name}({quote_ident(col)})"
+            for col in _INDEXED_COLUMNS if col in df.columns
+        ]
+
+        # Serialize once; empty fields become NULL under COPY ... NULL ''
+        out = io.StringIO()
+        df.to_csv(out, index=False, header=False, na_rep='')
+        out.seek(0)
+
+        # DROP + CREATE + COPY + indexes commit atomically on one connection,
+        # so a failed load can never leave a dropped or half-filled table
+        fallback = False
+        raw = self.engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            # The pool-wide statement_timeout guards user queries; a big
+            # COPY legitimately runs past it. SET LOCAL expires at commit,
+            # so the connection goes back to the pool unchanged
+            cur.execute("SET LOCAL statement_timeout = 0")
+            cur.execute(f"DROP TABLE IF EXISTS {table_name} CASCADE")
+            cur.execute(f"CREATE TABLE {table_name} (id BIGSERIAL PRIMARY KEY, {column_ddl})")
+            if hasattr(cur, "copy_expert"):
+                cur.copy_expert(
+                    f"COPY {table_name} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '')",
+                    out
+                )
+                for ddl in index_ddl:
+                    cur.execute(ddl)
+                raw.commit()
+            else:
+                # Non-psycopg2 driver: commit the empty table, then batch
+                # multi-row VALUES inserts below
+                raw.commit()
+                fallback = True
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+        if fallback:
+            self._bulk_insert_fallback(df, table_name)
+            with self.engine.begin() as conn:
+                conn.execute(text("SET LOCAL statement_timeout = 0"))
+                for ddl in index_ddl:
+                    conn.execute(text(ddl))
+
+        # ANALYZE so the planner picks the fresh indexes up immediately
+        with self.engine.begin() as conn:
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            conn.execute(text(f"ANALYZE {table_name}"))
+
+    def _bulk_insert_fallback(self, df: pd.DataFrame, table_name: str):
+        """Insert path for when COPY is unusable: psycopg2 execute_values
+        pages 10k rows per VALUES statement; generic to_sql is last resort"""
+        raw = self.engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            cur.execute("SET LOCAL statement_timeout = 0")
+            if type(cur).__module__.startswith("psycopg2"):
+                from psycopg2.extras import execute_values
+                execute_values(
+                    cur,
+                    f"INSERT INTO {table_name} "
+                    f"({', '.join(quote_ident(col) for col in df.columns)}) VALUES %s",
+                    df.itertuples(index=False, name=None),
+                    page_size=10000,
+                )
+                raw.commit()
+                return
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+        df.to_sql(table_name, self.engine, if_exists='append', index=False,
+                  method='multi', chunksize=5000)
+
+
+data_loader = DataLoader(engine)
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger("hospital.ollama")
+
+
+class OllamaService:
+    """Shared async Ollama client.
+
+    One keep-alive httpx.AsyncClient for every endpoint that talks to the
+    model, plus micro-batching for non-streaming /api/generate calls:
+    concurrent prompts are collected for a short window and dispatched
+    together so Ollama's continuous batching (OLLAMA_NUM_PARALLEL) sees
+    them as one wave.
+    """
+
+    BATCH_MAX = 8
+    BATCH_WINDOW = 0.01  # seconds
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            base_url=settings.OLLAMA_URL,
+            timeout=httpx.Timeout(120.0),
+            # Enough parallel sockets for a full micro-batch wave, kept
+            # alive well past Ollama's idle gaps so no request pays a
+            # fresh TCP handshake
+            limits=httpx.Limits(
+                max_connections=32,
+                max_keepalive_connections=16,
+                keepalive_expiry=90.0,
+            ),
+        )
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._dispatcher = None
+
+    def start(self):
+        """Spawn the micro-batch dispatcher; called from the lifespan hook"""
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def aclose(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        await self.client.aclose()
+
+    async def _dispatch_loop(self):
+        """Collect prompts into micro-batches and hand each wave off"""
+        while True:
+            entry = await self._queue.get()
+            batch = [entry]
+            deadline = time.monotonic() + self.BATCH_WINDOW
+            while len(batch) < self.BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Fan the wave out in its own task and go straight back to
+            # collecting - one slow generation must not head-of-line
+            # block every prompt that arrives while it is in flight
+            asyncio.create_task(self._send_batch(batch))
+
+    async def _send_batch(self, batch):
+        """POST one wave of payloads and fan the responses back to their futures"""
+        responses = await asyncio.gather(
+            *(self.client.post("/api/generate", json=payload, timeout=120)
+              for payload, _ in batch),
+            return_exceptions=True,
+        )
+        for (_, future), resp in zip(batch, responses):
+            if future.cancelled():
+                continue
+            if isinstance(resp, Exception):
+                future.set_exception(resp)
+            else:
+                future.set_result(resp)
+
+    async def generate(self, payload: dict) -> httpx.Response:
+        """Submit a non-streaming /api/generate payload through the micro-batcher"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((payload, future))
+        return await future
+
+    def stream_generate(self, payload: dict):
+        """Streaming /api/generate; returns the httpx stream context manager"""
+        return self.client.stream("POST", "/api/generate", json=payload)
+
+    async def warm_model(self):
+        """Pull the model into memory so the first real query is not cold"""
+        try:
+            await self.client.post(
+                "/api/generate",
+                json={"model": settings.OLLAMA_MODEL,
+                      "keep_alive": settings.OLLAMA_KEEP_ALIVE},
+                timeout=120,
+            )
+        except Exception as e:
+            logger.warning("Model warmup failed: %s", e)
+
+    async def check(self) -> bool:
+        """Cheap reachability probe against /api/tags"""
+        try:
+            resp = await self.client.get("/api/tags", timeout=5)
+            return resp.status_code == 200
+        except Exception as e:
+            logger.warning("Ollama not reachable: %s", e)
+            return False
+
+
+ollama_service = OllamaService()